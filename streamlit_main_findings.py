@@ -1,8 +1,22 @@
 
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+from urllib.request import urlopen
+
+import numpy as np
 import streamlit as st
 import pandas as pd
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
 
+# copy-on-write (default from pandas 3)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
 st.set_page_config(page_title="Main Findings Dashboard", layout="wide")
 
 st.title("Main Findings Dashboard-China and the Global Rise of CO₂ Emissions")
@@ -11,17 +25,47 @@ st.caption("A concise, presentation-ready dashboard showing only the key results
 # -----------------------------
 # Data (default: OWID CO₂)
 # -----------------------------
-@st.cache_data(show_spinner=False)
+OWID_URL = "https://raw.githubusercontent.com/owid/co2-data/master/owid-co2-data.csv"
+OWID_COLUMNS = ["country", "year", "iso_code", "population", "co2", "co2_per_capita"]
+OWID_CACHE = Path.home() / ".cache" / "owid_co2.parquet"
+OWID_TTL = 24 * 60 * 60  # seconds; refresh the OWID snapshot daily
+
+@st.cache_data(show_spinner=False, ttl=OWID_TTL)
 def load_default():
-    url = "https://raw.githubusercontent.com/owid/co2-data/master/owid-co2-data.csv"
-    return pd.read_csv(url)
+    # refresh the local Parquet snapshot at most once a day
+    stale = not OWID_CACHE.exists() or time.time() - OWID_CACHE.stat().st_mtime > OWID_TTL
+    if stale:
+        try:
+            # empty strings stay null, as with pd.read_csv
+            with urlopen(OWID_URL) as resp:
+                table = pacsv.read_csv(resp, convert_options=pacsv.ConvertOptions(
+                    include_columns=OWID_COLUMNS, strings_can_be_null=True))
+        except Exception:
+            if not OWID_CACHE.exists():
+                raise
+            # offline: fall back to the last snapshot we have
+        else:
+            # atomic swap
+            OWID_CACHE.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=OWID_CACHE.parent, suffix=".parquet.tmp")
+            os.close(fd)
+            try:
+                pq.write_table(table, tmp, compression="zstd")
+                os.replace(tmp, OWID_CACHE)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+    # snapshot mtime is the dataset key
+    with open(OWID_CACHE, "rb") as f:
+        mtime = os.fstat(f.fileno()).st_mtime
+        return pd.read_parquet(f, columns=OWID_COLUMNS, engine="pyarrow"), mtime
 
 use_default = st.toggle("Use default OWID dataset", value=True, help="Turn off to upload your own CSV.")
 file = None if use_default else st.file_uploader("Upload CSV with columns at least: country, year, co2, co2_per_capita, population (optional)", type=["csv"])
 
 if use_default:
     try:
-        co2 = load_default()
+        co2, dataset_key = load_default()
     except Exception as e:
         st.error(f"Could not load default dataset: {e}")
         st.stop()
@@ -30,18 +74,102 @@ else:
         st.info("Upload a CSV to continue.")
         st.stop()
     co2 = pd.read_csv(file)
+    dataset_key = file.file_id
 
 # basic clean
 for col in ["country","year","co2","co2_per_capita"]:
     if col not in co2.columns:
         st.error(f"Missing required column: {col}")
         st.stop()
-co2 = co2.dropna(subset=["country","year"]).copy()
-co2["year"] = co2["year"].astype(int)
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def prepare(dataset_key, _co2):
+    co2 = _co2.dropna(subset=["country","year"])
+    # optional columns (an empty or non-text iso_code counts as missing)
+    iso_values = co2["iso_code"].dropna() if "iso_code" in co2.columns else None
+    has_iso = iso_values is not None and len(iso_values) > 0 and pd.api.types.is_string_dtype(iso_values)
+    has_pop = "population" in co2.columns
+    co2["year"] = co2["year"].astype(int)
+
+    # downcast
+    co2 = co2.astype({"year": "int16", "co2": "float32", "co2_per_capita": "float32"})
+    if has_pop:
+        co2["population"] = co2["population"].astype("float32")
+    co2["country"] = co2["country"].astype("category")
+    if has_iso:
+        co2["iso_code"] = co2["iso_code"].astype("category")
+
+    # aggregate rows: missing/OWID_* iso code, else World|International by name
+    if has_iso:
+        iso_cat = co2["iso_code"].cat
+        bad_iso = np.append(iso_cat.categories.str.startswith("OWID_"), True)  # code -1 = missing
+        is_aggregate = bad_iso[iso_cat.codes.to_numpy()]
+    else:
+        country_cat = co2["country"].cat
+        is_aggregate = country_cat.categories.str.contains("World|International", case=False, na=False)[country_cat.codes.to_numpy()]
+    co2["is_aggregate"] = is_aggregate
+    return co2, has_iso, has_pop
+
+co2, HAS_ISO, HAS_POP = prepare(dataset_key, co2)
+
+# derived structures (keyed on dataset_key)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def by_year(dataset_key, _co2):
+    # per-year slices of country rows
+    countries_only = _co2[~_co2["is_aggregate"]]
+    return {int(y): g for y, g in countries_only.groupby("year", sort=False)}
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def country_series(dataset_key, _co2):
+    # per-country (years, co2) arrays, year-sorted once
+    out = {}
+    for c, g in _co2.sort_values(["country","year"]).groupby("country", observed=True):
+        out[c] = (g["year"].to_numpy(), g["co2"].to_numpy())
+    return out
+
+by_year_map = by_year(dataset_key, co2)
+series_map = country_series(dataset_key, co2)
+no_rows = co2.iloc[:0]
+
+def year_slice(year):
+    # cleaned per-year frame shared by the Top Emitters and Per-capita tabs
+    return by_year_map.get(year, no_rows)
+
+def top_k(df, col, k=10):
+    # same result as DataFrame.nlargest; expects no NaNs in col
+    v = df[col].to_numpy()
+    if len(v) > k:
+        kth = np.partition(v, len(v) - k)[len(v) - k]  # k-th largest value
+        idx = np.flatnonzero(v >= kth)  # row order, keeps ties at the cut like nlargest
+    else:
+        idx = np.arange(len(v))
+    return df.iloc[idx[np.argsort(-v[idx], kind="stable")][:k]]
+
+# -----------------------------
+# Time-series figure
+# -----------------------------
+def fig_to_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=200)
+    return buf.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def timeseries_png(lines, focus_country):
+    fig = plt.figure()
+    try:
+        for c, (yrs, vals) in lines.items():
+            plt.plot(yrs, vals, linewidth=3 if c == focus_country else 1)
+        plt.xlabel("Year")
+        plt.ylabel("CO₂ (million tonnes)")
+        plt.title(f"CO₂ over Time — Highlight: {focus_country}")
+        return fig_to_png(fig)
+    finally:
+        plt.close(fig)
 
 # filters (limited to keep it 'findings-only')
 min_year, max_year = int(co2["year"].min()), int(co2["year"].max())
-default_focus = "China" if "China" in set(co2["country"]) else co2["country"].iloc[0]
+country_set = co2["country"].cat.categories
+default_focus = "China" if "China" in country_set else co2["country"].iloc[0]
 
 
 # Tabs correspond to key findings sections only
@@ -55,25 +183,20 @@ tab8, tab9, tab10 = st.tabs(
 with tab8:
     year_for_rank = st.slider("Select ranking year", min_value=min_year, max_value=max_year, value=min(2014, max_year))
     st.subheader(f"Top 10 CO₂ Emitters — {year_for_rank}")
-    d = co2[co2["year"] == year_for_rank].copy()
-    d = d[~d["country"].str.contains("World|International", case=False, na=False)]
-    if "iso_code" in d.columns:
-        d = d[~d["iso_code"].isin(["OWID_WRL","OWID_KOS"])]
+    d = year_slice(year_for_rank)
     d = d.dropna(subset=["co2"])
-    top = d.nlargest(10, "co2")[["country","co2"]]
+    top = top_k(d, "co2")[["country","co2"]]
+    top_display = top.rename(columns={"country":"Country","co2":"CO₂ (Mt)"}).astype({"Country": str})
 
     col1, col2 = st.columns([2,1])
     with col1:
-        fig = plt.figure()
-        plt.barh(top["country"][::-1], top["co2"][::-1])
-        plt.xlabel("CO₂ (million tonnes)")
-        plt.ylabel("Country")
-        plt.title(f"Top 10 Emitters — {year_for_rank}")
-        st.pyplot(fig, clear_figure=True)
+        st.bar_chart(top_display, x="Country", y="CO₂ (Mt)", horizontal=True, sort="-CO₂ (Mt)")
     with col2:
-        st.metric("World CO₂ (Mt)", value=f"{d['co2'].sum():,.0f}")
-        st.metric("Median CO₂ (Mt)", value=f"{d['co2'].median():,.0f}")
-        st.dataframe(top.rename(columns={"country":"Country","co2":"CO₂ (Mt)"}).style.format({"CO₂ (Mt)":"{:.0f}"}), use_container_width=True)
+        summary = pd.DataFrame({"CO₂ (Mt)": [d["co2"].sum(), d["co2"].median()]}, index=["World", "Median"])
+        st.dataframe(summary, width="stretch",
+                     column_config={"CO₂ (Mt)": st.column_config.NumberColumn(format="%.0f")})
+        st.dataframe(top_display, width="stretch",
+                     column_config={"CO₂ (Mt)": st.column_config.NumberColumn(format="%.0f")})
 
     st.markdown("""
     **Key Takeaways:**
@@ -87,26 +210,20 @@ with tab8:
 # -----------------------------
 with tab9:
     st.subheader("CO₂ Emissions Over Time — China")
-    focus_country = st.selectbox("China", sorted(co2["country"].unique()), index=sorted(co2["country"].unique()).index(default_focus) if default_focus in set(co2["country"]) else 0)
-    # choose comparison set: top 7 emitters in the selected ranking year
-    pool = co2[co2["year"] == year_for_rank].nlargest(8, "co2")["country"].tolist()
-    comps = [c for c in pool if c != focus_country][:5]
+    # categories are already the sorted unique country names
+    focus_country = st.selectbox("China", country_set, index=int(country_set.get_loc(default_focus)))
+    # choose comparison set: top emitters in the selected ranking year
+    comps = [c for c in top["country"] if c != focus_country][:5]
     st.caption(f"Comparing {focus_country} to: {', '.join(comps) if comps else '—'}")
     yr_min, yr_max = st.slider("Show years", min_value=min_year, max_value=max_year, value=(max(min_year, 1950), max_year))
 
-    dd = co2[(co2["year"] >= yr_min) & (co2["year"] <= yr_max)].copy()
-    subset = dd[dd["country"].isin([focus_country] + comps)]
-    fig = plt.figure()
-    for c in subset["country"].unique():
-        s = subset[subset["country"] == c].sort_values("year")
-        if c == focus_country:
-            plt.plot(s["year"], s["co2"], linewidth=3)
-        else:
-            plt.plot(s["year"], s["co2"], linewidth=1)
-    plt.xlabel("Year")
-    plt.ylabel("CO₂ (million tonnes)")
-    plt.title(f"CO₂ over Time — Highlight: {focus_country}")
-    st.pyplot(fig, clear_figure=True)
+    lines = {}
+    for c in sorted([focus_country] + comps):
+        if c in series_map:
+            yrs, vals = series_map[c]
+            m = (yrs >= yr_min) & (yrs <= yr_max)
+            lines[c] = (yrs[m], vals[m])
+    st.image(timeseries_png(lines, focus_country), width="stretch")
 
     st.markdown("""
     **Key Takeaways:**
@@ -126,30 +243,23 @@ with tab10:
         key="year_pc_slider"
     )
 
-    d_pc = co2[co2["year"] == year_pc].copy()
-    # remove aggregates and tiny populations
-    if "iso_code" in d_pc.columns:
-        d_pc = d_pc[~d_pc["iso_code"].isin(["OWID_WRL","OWID_KOS"])]
-    d_pc = d_pc[~d_pc["country"].str.contains("World|International", case=False, na=False)]
-    if "population" in d_pc.columns:
+    d_pc = year_slice(year_pc)
+    # remove tiny populations (aggregates are already gone)
+    if HAS_POP:
         d_pc = d_pc[d_pc["population"] > 1_000_000]
 
     d_pc = d_pc.dropna(subset=["co2_per_capita"])
-    top_pc = d_pc.nlargest(10, "co2_per_capita")[["country", "co2_per_capita"]]
+    top_pc = top_k(d_pc, "co2_per_capita")[["country", "co2_per_capita"]]
+    top_pc_display = top_pc.rename(columns={"country":"Country","co2_per_capita":"Tonnes/person"}).astype({"Country": str})
 
     c1, c2 = st.columns([2,1])
     with c1:
-        fig = plt.figure()
-        plt.barh(top_pc["country"][::-1], top_pc["co2_per_capita"][::-1])
-        plt.xlabel("Tonnes per person")
-        plt.ylabel("Country")
-        plt.title(f"Top 10 per-capita — {year_pc}")
-        st.pyplot(fig, clear_figure=True)
+        st.bar_chart(top_pc_display, x="Country", y="Tonnes/person", horizontal=True, sort="-Tonnes/person")
     with c2:
         st.dataframe(
-            top_pc.rename(columns={"country":"Country","co2_per_capita":"Tonnes/person"})
-                  .style.format({"Tonnes/person":"{:.2f}"}),
-            use_container_width=True
+            top_pc_display,
+            width="stretch",
+            column_config={"Tonnes/person": st.column_config.NumberColumn(format="%.2f")}
         )
 
     st.markdown("""